@@ -1,144 +1,190 @@
 #!/usr/bin/env python3
 
-import boto3
-import logging
-import optparse
+import argparse
+import functools
 import os
-import shutil
-import subprocess
 import sys
 
-logger = logging.Logger('envoi-s3')
-logger.setLevel(logging.WARN)
 
+def _log_error(msg):
+    """
+    Report an error on stderr.
 
-def augment_common(cmd_args, env_vars):
-    access_key = os.getenv('S3_ACCESS_KEY')
-    if access_key:
-        env_vars.setdefault('AWS_ACCESS_KEY_ID', access_key)
+    :param msg: The message to report.
+    """
+    print(f"envoi-s3: {msg}", file=sys.stderr)
 
-    secret_key = os.getenv('S3_SECRET_KEY')
-    if secret_key:
-        env_vars.setdefault('AWS_SECRET_ACCESS_KEY', secret_key)
 
-    return cmd_args, env_vars
+# Environment variables consulted when augmenting client arguments. They do not change for the lifetime of the
+# process, so they are read once at import rather than on every lookup.
+_ENV_CACHE = {k: os.environ.get(k) for k in (
+    'S3_ACCESS_KEY',
+    'S3_SECRET_KEY',
+    'AWS_ENDPOINT_URL_S3',
+    'S3_ENDPOINT_URL',
+    'S3_REGION',
+    'AWS_REGION',
+    'AWS_DEFAULT_REGION',
+)}
 
+# The client found on PATH when --client is not supplied, resolved at most once.
+_CLIENT_CACHE = None
 
-def augment_aws_arguments(cmd_args, env_vars):
+# Cached assumed role credentials are reused until this many seconds before they expire.
+_STS_EXPIRATION_MARGIN_SECONDS = 300
 
-    cmd_args, env_vars = augment_common(cmd_args, env_vars)
+# The keys of the assumed role credentials that are cached between invocations.
+_STS_CACHED_KEYS = ('AccessKeyId', 'SecretAccessKey', 'SessionToken', 'Expiration')
 
-    endpoint_url = os.getenv('AWS_ENDPOINT_URL_S3') or os.getenv('S3_ENDPOINT_URL')
-    if '--endpoint-url' not in cmd_args and endpoint_url is not None:
-        cmd_args.extend(['--endpoint-url', endpoint_url])
+# Subcommands supported by the in-process awscrt client selected with --client crt.
+_CRT_COPY_COMMANDS = {'cp', 'get', 'put'}
 
-    return cmd_args, env_vars
+# The most transfers the crt client keeps in flight when copying several files.
+_CRT_MAX_IN_FLIGHT = min(32, 4 * (os.cpu_count() or 1))
 
 
-def augment_s4cmd_arguments(cmd_args, env_vars):
+def _copy_env(env_vars):
     """
-    Augments the given cmd_args list with necessary arguments to configure s4cmd.
+    Return an environment that can be modified, copying os.environ only when no copy has been made yet.
 
-    :param cmd_args: The list of command line arguments for s4cmd.
-    :param env_vars: Environment variables to be set in the subprocess environment.
-    :return: The updated cmd_args list with additional arguments.
+    :param env_vars: The environment built so far or None if the client should inherit os.environ unchanged.
+    :return: A dict of environment variables.
     """
+    return os.environ.copy() if env_vars is None else env_vars
 
-    cmd_args, env_vars = augment_common(cmd_args, env_vars)
 
-    endpoint_url = os.getenv('AWS_ENDPOINT_URL_S3') or os.getenv('S3_ENDPOINT_URL')
-    if endpoint_url is not None:
-        cmd_args.extend(['--endpoint', endpoint_url])
+def _setdefault_env(env_vars, key, value):
+    """
+    Set an environment variable for the client unless it is already set or the value is empty.
 
-    if '--region' not in cmd_args:
-        region = os.getenv('S3_REGION')
-        if region is not None:
-            cmd_args.extend(['--region', region])
+    :param env_vars: The environment built so far or None if the client should inherit os.environ unchanged.
+    :param key: The name of the environment variable.
+    :param value: The value to set.
+    :return: The environment, which is only copied from os.environ if it has to be modified.
+    """
+    if not value or key in (os.environ if env_vars is None else env_vars):
+        return env_vars
 
-    return cmd_args, env_vars
+    env_vars = _copy_env(env_vars)
+    env_vars[key] = value
+    return env_vars
 
 
-def augment_s5cmd_arguments(cmd_args, env_vars):
-    cmd_args, env_vars = augment_common(cmd_args, env_vars)
+def augment_aws_arguments(cmd_args, env_vars):
+    env_vars = _setdefault_env(env_vars, 'AWS_ACCESS_KEY_ID', _ENV_CACHE['S3_ACCESS_KEY'])
+    env_vars = _setdefault_env(env_vars, 'AWS_SECRET_ACCESS_KEY', _ENV_CACHE['S3_SECRET_KEY'])
+
+    endpoint_url = _ENV_CACHE['AWS_ENDPOINT_URL_S3'] or _ENV_CACHE['S3_ENDPOINT_URL']
+    if '--endpoint-url' not in cmd_args and endpoint_url is not None:
+        cmd_args.extend(['--endpoint-url', endpoint_url])
 
     return cmd_args, env_vars
 
 
-def aws_wrapper(cmd_args, env_vars):
+def augment_s4cmd_arguments(cmd_args, env_vars):
     """
-    Wrapper function for running the `aws s3` command with supplied arguments.
+    Augments the given cmd_args list with necessary arguments to configure s4cmd.
 
-    :param cmd_args: List of command line arguments to be pass to aws s3.
-    :param env_vars: Environment variables to be set in the subprocess environment.
-    :return: Process object representing the completed command.
+    :param cmd_args: The list of command line arguments for s4cmd.
+    :param env_vars: Environment variables to be set in the client environment.
+    :return: The updated cmd_args list with additional arguments.
     """
-    cmd_args, env_vars = augment_aws_arguments(cmd_args, env_vars)
+    env_vars = _setdefault_env(env_vars, 'AWS_ACCESS_KEY_ID', _ENV_CACHE['S3_ACCESS_KEY'])
+    env_vars = _setdefault_env(env_vars, 'AWS_SECRET_ACCESS_KEY', _ENV_CACHE['S3_SECRET_KEY'])
 
-    cmd = ['aws', 's3'] + cmd_args
+    # Options may be given as --name value or --name=value, --endpoint is accepted by s4cmd as an abbreviation of
+    # --endpoint-url.
+    flags = {arg.split('=', 1)[0] for arg in cmd_args if arg.startswith('--')}
 
-    process = subprocess.run(cmd, check=True, env=env_vars)
+    endpoint_url = _ENV_CACHE['AWS_ENDPOINT_URL_S3'] or _ENV_CACHE['S3_ENDPOINT_URL']
+    if flags.isdisjoint(('--endpoint', '--endpoint-url')) and endpoint_url is not None:
+        cmd_args.extend(['--endpoint', endpoint_url])
 
-    return process
+    region = _ENV_CACHE['S3_REGION']
+    if '--region' not in flags and region is not None:
+        cmd_args.extend(['--region', region])
 
+    return cmd_args, env_vars
 
-def s4cmd_wrapper(cmd_args, env_vars):
-    """
-    Wrapper function for running the `s4cmd` command with supplied arguments.
 
-    :param cmd_args: List of command line arguments to be pass to s4cmd.
-    :param env_vars: Environment variables to be set in the subprocess environment.
-    :return: Process object representing the completed command.
-    """
-    cmd_args, env_vars = augment_s4cmd_arguments(cmd_args, env_vars)
+def augment_s5cmd_arguments(cmd_args, env_vars):
+    env_vars = _setdefault_env(env_vars, 'AWS_ACCESS_KEY_ID', _ENV_CACHE['S3_ACCESS_KEY'])
+    env_vars = _setdefault_env(env_vars, 'AWS_SECRET_ACCESS_KEY', _ENV_CACHE['S3_SECRET_KEY'])
 
-    # Create the s4cmd command
-    cmd = ['s4cmd'] + cmd_args
+    return cmd_args, env_vars
 
-    # Run the command and capture the output
-    process = subprocess.run(cmd, check=True, env=env_vars)
 
-    return process
+# Maps each supported client name to the command that runs it and the function that augments its arguments.
+_CLIENTS = {
+    's4cmd': (('s4cmd',), augment_s4cmd_arguments),
+    's5cmd': (('s5cmd',), augment_s5cmd_arguments),
+    'aws': (('aws', 's3'), augment_aws_arguments),
+}
 
 
-def s5cmd_wrapper(cmd_args, env_vars):
+def build_cmd(client_name, cli_args, env_vars):
     """
-    Wrapper function for running the `s5cmd` command with supplied arguments.
+    Build the command line and environment for running the given client with supplied arguments.
 
-    :param cmd_args: A list of additional arguments to pass to the s5cmd command.
-    :param env_vars: Environment variables to be set in the subprocess environment.
-    :return: Process object representing the completed command.
+    :param client_name: The name of the client to run ('aws', 's4cmd', or 's5cmd').
+    :param cli_args: List of command line arguments to be passed to the client, it is modified in place to become
+        the command.
+    :param env_vars: Environment variables to be set in the client environment.
+    :return: A tuple of the command and environment, the command is None if the client name is unknown.
     """
-    cmd_args, env_vars = augment_s5cmd_arguments(cmd_args, env_vars)
+    client = _CLIENTS.get(client_name)
+    if client is None:
+        return None, env_vars
 
-    # Create the s4cmd command
-    cmd = ['s5cmd'] + cmd_args
+    prefix, augment = client
+    cli_args, env_vars = augment(cli_args, env_vars)
+    cli_args[:0] = prefix
 
-    # Run the command and capture the output
-    process = subprocess.run(cmd, check=True, env=env_vars)
-
-    return process
+    return cli_args, env_vars
 
 
 def parse_command_line(cli_args, env_vars):
-    parser = optparse.OptionParser(
+    parser = argparse.ArgumentParser(
         description='Envoi S3 Command Line Utility',
+        allow_abbrev=False,
     )
 
-    parser.add_option('--client', dest='client_name', default='s5cmd',
-                      help='The client to use when communicating with S3.')
-    parser.add_option('--role-arn', dest='role_arn', default=None,
-                      help='The arn for the IAM Role to assume.')
+    parser.add_argument('--client', dest='client_name', default=None,
+                        help='The client to use when communicating with S3, one of aws, crt, s4cmd, or s5cmd. '
+                             'Defaults to the first of s5cmd, s4cmd, or aws found on PATH.')
+    parser.add_argument('--role-arn', dest='role_arn', default=None,
+                        help='The arn for the IAM Role to assume.')
 
-    (opt, args) = parser.parse_args(cli_args)
+    (opt, args) = parser.parse_known_args(cli_args)
     return opt, args, env_vars
 
 
 def determine_client(opts):
     """Determine the client executable command.
 
-    :return: The first executable command from ['s5cmd', 's4cmd', 'aws'] or None if none of the commands are found.
+    :return: The client given with --client, otherwise the first executable command from ['s5cmd', 's4cmd', 'aws'] or
+        None if none of the commands are found.
+    """
+    if opts.client_name is not None:
+        return opts.client_name
+
+    global _CLIENT_CACHE
+    if _CLIENT_CACHE is None:
+        _CLIENT_CACHE = determine_first_executable_command(['s5cmd', 's4cmd', 'aws'])
+    return _CLIENT_CACHE
+
+
+@functools.lru_cache(maxsize=None)
+def _which(cmd):
     """
-    return opts.client_name or determine_first_executable_command(['s5cmd', 's4cmd', 'aws'])
+    Memoized shutil.which(), PATH does not change for the lifetime of the process.
+
+    :param cmd: The command to locate.
+    :return: The path to the command or None if it is not found.
+    """
+    import shutil
+
+    return shutil.which(cmd)
 
 
 def determine_first_executable_command(commands):
@@ -169,56 +215,362 @@ def determine_first_executable_command(commands):
     executed successfully. Its purpose is to simply determine if a command is executable or not.
     """
     for cmd in commands:
-        if shutil.which(cmd) is not None:
+        if _which(cmd) is not None:
             return cmd
 
 
+def _sts_cache_dir():
+    """
+    :return: The directory assumed role credentials are cached in between invocations.
+    """
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'envoi-s3')
+
+
+def _sts_cache_path(role_arn):
+    """
+    Determine the cache file for the credentials of a role.
+
+    The file name is derived from the role as well as the identity used to assume it, the AWS profile and access key
+    id, so switching identities does not hand out credentials that were obtained by a different identity.
+
+    :param role_arn: The arn for the IAM Role.
+    :return: The path of the cache file.
+    """
+    import hashlib
+
+    source_identity = '\0'.join((
+        role_arn,
+        os.environ.get('AWS_PROFILE') or os.environ.get('AWS_DEFAULT_PROFILE') or '',
+        os.environ.get('AWS_ACCESS_KEY_ID') or '',
+    ))
+    digest = hashlib.sha256(source_identity.encode('utf-8')).hexdigest()
+    return os.path.join(_sts_cache_dir(), f'sts-{digest}.json')
+
+
+def load_cached_credentials(role_arn):
+    """
+    Load previously assumed credentials for a role if they are not about to expire.
+
+    :param role_arn: The arn for the IAM Role.
+    :return: A dict with AccessKeyId, SecretAccessKey, SessionToken and Expiration, or None if there are no usable
+        cached credentials.
+    """
+    import datetime
+    import json
+
+    try:
+        with open(_sts_cache_path(role_arn)) as f:
+            credentials = json.load(f)
+        if not isinstance(credentials, dict) or not all(isinstance(credentials.get(k), str) for k in _STS_CACHED_KEYS):
+            return None
+        expiration = datetime.datetime.fromisoformat(credentials['Expiration'])
+        margin = datetime.timedelta(seconds=_STS_EXPIRATION_MARGIN_SECONDS)
+        if expiration - margin <= datetime.datetime.now(datetime.timezone.utc):
+            return None
+    except (OSError, ValueError, TypeError):
+        return None
+
+    return credentials
+
+
+def store_cached_credentials(role_arn, credentials):
+    """
+    Save assumed credentials for a role so later invocations can reuse them. The cache file is only readable by the
+    current user. Failing to write the cache is not an error.
+
+    :param role_arn: The arn for the IAM Role.
+    :param credentials: The Credentials returned by sts assume_role.
+    """
+    import json
+
+    cached = {
+        'AccessKeyId': credentials['AccessKeyId'],
+        'SecretAccessKey': credentials['SecretAccessKey'],
+        'SessionToken': credentials['SessionToken'],
+        'Expiration': credentials['Expiration'].isoformat(),
+    }
+    path = _sts_cache_path(role_arn)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(cached, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+
 def assume_role_using_arn(role_arn, env_vars):
-    sts_client = boto3.client('sts')
-    assumed_role_object = sts_client.assume_role(
-        RoleArn=role_arn,
-        RoleSessionName='envoi-s3'
-    )
-    credentials = assumed_role_object['Credentials']
+    credentials = load_cached_credentials(role_arn)
+    if credentials is None:
+        import boto3
+
+        sts_client = boto3.client('sts')
+        assumed_role_object = sts_client.assume_role(
+            RoleArn=role_arn,
+            RoleSessionName='envoi-s3'
+        )
+        credentials = assumed_role_object['Credentials']
+        store_cached_credentials(role_arn, credentials)
+
+    env_vars = _copy_env(env_vars)
     env_vars['AWS_ACCESS_KEY_ID'] = credentials['AccessKeyId']
     env_vars['AWS_SECRET_ACCESS_KEY'] = credentials['SecretAccessKey']
     env_vars['AWS_SESSION_TOKEN'] = credentials['SessionToken']
     return env_vars
 
 
-def execute_client(client_name, cli_args, env_vars):
+def _parse_s3_url(url):
     """
-    Execute a client based on the given client name and command-line arguments.
+    Split an s3:// url into its bucket and key.
+
+    :param url: The url to split.
+    :return: A tuple of bucket and key, or None if the url is not an s3:// url.
+    """
+    if not url.startswith('s3://'):
+        return None
+
+    bucket, _, key = url[len('s3://'):].partition('/')
+    if not bucket:
+        return None
+
+    return bucket, key
 
-    :param client_name: The name of the client to execute ('aws', 's4cmd', or 's5cmd').
-    :param cli_args: The command-line arguments to be passed to the client.
-    :param env_vars:
 
-    :return: None
+def plan_crt_transfer(cli_args):
     """
-    process = None
-    exit_code = 0
+    Determine the transfers to run for the crt client.
+
+    Only `cp`, `get` and `put` without options are supported, either copying a single local file to or from an
+    s3:// url, or several local files with distinct file names to an s3:// prefix ending in '/'.
+
+    :param cli_args: The command-line arguments passed to the crt client.
+    :return: A list of (direction, bucket, key, local path) tuples where direction is 'put' or 'get', or None if the
+        command is not supported.
+    """
+    if len(cli_args) < 3 or cli_args[0] not in _CRT_COPY_COMMANDS:
+        return None
+
+    sources, target = cli_args[1:-1], cli_args[-1]
+    if target.startswith('-') or any(source.startswith('-') for source in sources):
+        return None
+
+    s3_target = _parse_s3_url(target)
+
+    if s3_target is not None:
+        bucket, key = s3_target
+        is_prefix = not key or key.endswith('/')
+        if len(sources) > 1 and not is_prefix:
+            return None
+
+        transfers = []
+        keys = set()
+        for source in sources:
+            if _parse_s3_url(source) is not None or not os.path.isfile(source):
+                return None
+            source_key = key + os.path.basename(source) if is_prefix else key
+            # Sources sharing a file name would be uploaded concurrently to the same key.
+            if source_key in keys:
+                return None
+            keys.add(source_key)
+            transfers.append(('put', bucket, source_key, source))
+        return transfers
+
+    if len(sources) != 1:
+        return None
+
+    s3_source = _parse_s3_url(sources[0])
+    if s3_source is None:
+        return None
+
+    bucket, key = s3_source
+    if not key or key.endswith('/'):
+        return None
+    if os.path.isdir(target):
+        target = os.path.join(target, key.rsplit('/', 1)[-1])
+    return [('get', bucket, key, target)]
+
+
+def _remove_partial_download(tmp_path):
+    """
+    Remove the temporary file of a download that did not complete, if there is one.
+
+    :param tmp_path: The temporary file the download was written to, or None for uploads.
+    """
+    if tmp_path is None:
+        return
+
     try:
-        if client_name == 's4cmd':
-            process = s4cmd_wrapper(cli_args, env_vars)
-        elif client_name == 's5cmd':
-            process = s5cmd_wrapper(cli_args, env_vars)
-        elif client_name == 'aws':
-            process = aws_wrapper(cli_args, env_vars)
-        else:
-            logger.error(f"Unknown client name: {client_name}")
+        os.unlink(tmp_path)
+    except OSError:
+        pass
+
+
+def _crt_wait(in_flight, return_when):
+    """
+    Wait for in-flight crt requests and report the ones that failed. Completed downloads are moved from their
+    temporary file onto the target, failed downloads have their temporary file removed so existing files are left
+    untouched.
+
+    :param in_flight: A dict mapping each request's finished future to a tuple of the request, its s3:// url, the
+        temporary file of a download or None, and the local path. Completed requests are removed from it.
+    :param return_when: When to stop waiting, as for concurrent.futures.wait().
+    :return: 1 if any of the completed requests failed, otherwise 0.
+    """
+    import concurrent.futures
+
+    from awscrt.exceptions import AwsCrtError
+
+    exit_code = 0
+    done, _ = concurrent.futures.wait(in_flight, return_when=return_when)
+    for future in done:
+        _, url, tmp_path, local_path = in_flight.pop(future)
+        try:
+            future.result()
+            if tmp_path is not None:
+                os.replace(tmp_path, local_path)
+        except (AwsCrtError, OSError) as e:
+            _log_error(f"Error copying {url}: {str(e)}")
+            _remove_partial_download(tmp_path)
             exit_code = 1
 
-        if process:
-            exit_code = process.returncode
+    return exit_code
+
+
+def crt_transfer(cli_args, env_vars):
+    """
+    Copy files to or from S3 in-process using awscrt, avoiding the start up of an external client. This is the crt
+    client selected with --client crt. Several files are copied concurrently. Requires the awscrt package, an AWS
+    region from S3_REGION, AWS_REGION or AWS_DEFAULT_REGION, and no custom endpoint.
+
+    :param cli_args: The command-line arguments passed to the crt client.
+    :param env_vars: Environment variables for the client, or None to use os.environ.
+    :return: The exit code.
+    """
+    try:
+        from awscrt.auth import AwsCredentialsProvider
+        from awscrt.http import HttpHeaders, HttpRequest
+        from awscrt.io import ClientBootstrap, DefaultHostResolver, EventLoopGroup
+        from awscrt.s3 import S3Client, S3RequestType
+    except ImportError:
+        _log_error("The crt client requires the awscrt package")
+        return 1
+
+    if _ENV_CACHE['AWS_ENDPOINT_URL_S3'] or _ENV_CACHE['S3_ENDPOINT_URL']:
+        _log_error("The crt client does not support custom endpoints")
+        return 1
+
+    region = _ENV_CACHE['S3_REGION'] or _ENV_CACHE['AWS_REGION'] or _ENV_CACHE['AWS_DEFAULT_REGION']
+    if not region:
+        _log_error("The crt client requires S3_REGION, AWS_REGION or AWS_DEFAULT_REGION to be set")
+        return 1
+
+    transfers = plan_crt_transfer(cli_args)
+    if transfers is None:
+        _log_error("The crt client only supports cp, get and put of a single file to or from an s3:// url, or of "
+                   "several files with distinct names to an s3:// prefix")
+        return 1
+
+    # Virtual hosted style requests over TLS do not work for bucket names containing dots.
+    bucket = transfers[0][1]
+    if '.' in bucket:
+        _log_error(f"The crt client does not support bucket names containing dots: {bucket}")
+        return 1
+
+    import concurrent.futures
+    from urllib.parse import quote
+
+    env = os.environ if env_vars is None else env_vars
+    access_key = env.get('AWS_ACCESS_KEY_ID') or _ENV_CACHE['S3_ACCESS_KEY']
+    secret_key = env.get('AWS_SECRET_ACCESS_KEY') or _ENV_CACHE['S3_SECRET_KEY']
+
+    event_loop_group = EventLoopGroup()
+    bootstrap = ClientBootstrap(event_loop_group, DefaultHostResolver(event_loop_group))
+    if access_key and secret_key:
+        credential_provider = AwsCredentialsProvider.new_static(access_key, secret_key,
+                                                                env.get('AWS_SESSION_TOKEN'))
+    else:
+        credential_provider = AwsCredentialsProvider.new_default_chain(bootstrap)
+    s3_client = S3Client(bootstrap=bootstrap, region=region, credential_provider=credential_provider)
+
+    host = f'{bucket}.s3.{region}.amazonaws.com'
+    exit_code = 0
+    in_flight = {}
+    for direction, _, key, local_path in transfers:
+        if len(in_flight) >= _CRT_MAX_IN_FLIGHT:
+            exit_code |= _crt_wait(in_flight, concurrent.futures.FIRST_COMPLETED)
+
+        path = '/' + quote(key, safe='/~')
+        url = f's3://{bucket}/{key}'
+        tmp_path = None
+        try:
+            if direction == 'put':
+                headers = HttpHeaders([('Host', host), ('Content-Length', str(os.path.getsize(local_path)))])
+                s3_request = s3_client.make_request(type=S3RequestType.PUT_OBJECT,
+                                                    request=HttpRequest('PUT', path, headers),
+                                                    send_filepath=local_path)
+            else:
+                # awscrt truncates recv_filepath before sending the request, so download next to the target and
+                # only replace it once the download has completed.
+                tmp_path = f'{local_path}.{os.getpid()}.tmp'
+                headers = HttpHeaders([('Host', host)])
+                s3_request = s3_client.make_request(type=S3RequestType.GET_OBJECT,
+                                                    request=HttpRequest('GET', path, headers),
+                                                    recv_filepath=tmp_path)
+        except (OSError, RuntimeError) as e:
+            # awscrt reports failures to open the local file as RuntimeError from make_request().
+            _log_error(f"Error copying {url}: {str(e)}")
+            _remove_partial_download(tmp_path)
+            exit_code = 1
+            continue
+        in_flight[s3_request.finished_future] = (s3_request, url, tmp_path, local_path)
 
-    except Exception as e:
-        logger.error(f"Error running client {client_name}: {str(e)}")
-        exit_code = 1
+    exit_code |= _crt_wait(in_flight, concurrent.futures.ALL_COMPLETED)
 
     return exit_code
 
 
+def execute_client(client_name, cli_args, env_vars):
+    """
+    Execute a client based on the given client name and command-line arguments.
+
+    The crt client runs in-process, see crt_transfer(). Any other client replaces the current process, so this only
+    returns if the client could not be started. The exit code of the client therefore becomes the exit code of
+    envoi-s3.
+
+    :param client_name: The name of the client to execute ('aws', 'crt', 's4cmd', or 's5cmd').
+    :param cli_args: The command-line arguments to be passed to the client.
+    :param env_vars: Environment variables to be set in the client environment, or None to inherit os.environ.
+
+    :return: The exit code of the crt client or the exit code to use if the client could not be started.
+    """
+    if client_name is None:
+        _log_error("No S3 client found, install one of s5cmd, s4cmd, or aws")
+        return 1
+
+    if client_name == 'crt':
+        return crt_transfer(cli_args, env_vars)
+
+    cmd, env_vars = build_cmd(client_name, cli_args, env_vars)
+    if cmd is None:
+        _log_error(f"Unknown client name: {client_name}")
+        return 1
+
+    try:
+        if env_vars is None:
+            os.execvp(cmd[0], cmd)
+        else:
+            os.execvpe(cmd[0], cmd, env_vars)
+    except OSError as e:
+        _log_error(f"Error running client {client_name}: {str(e)}")
+
+    return 1
+
+
 def is_executable(cmd):
     """
     Check if a given command is executable.
@@ -226,12 +578,12 @@ def is_executable(cmd):
     :param cmd: The command to check for executability.
     :return: True if the command is executable, False otherwise.
     """
-    return shutil.which(cmd)
+    return _which(cmd)
 
 
 def main():
     cli_args = sys.argv[1:]
-    env_vars = os.environ.copy()
+    env_vars = None
     (opts, remaining_args, env_vars) = parse_command_line(cli_args, env_vars)
     client_name = determine_client(opts)
 